@@ -10,19 +10,25 @@ Basic idea for the triggering
 from ASKAPTrigger.askaptrigger import ASKAPSchedBlock
 
 import sqlite3
-import urllib
+from urllib.parse import quote, urlencode, urlsplit
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
 import time
 import sys
 import os
+import pathlib
 
 import pandas as pd
 
-from astropy.time import Time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
+
 from astropy.coordinates import AltAz, EarthLocation, SkyCoord
 from astropy import units
-from datetime import datetime, timezone
 
 ### stop downloading recent iers - this can cause significant delay...
 from astropy.utils import iers
@@ -31,16 +37,35 @@ iers.conf.auto_download = False
 os.makedirs("./log", exist_ok=True)
 
 import logging
+import logging.handlers
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 # stream handler
-fh = logging.handlers.RotatingFileHandler(f"./log/mwatrigger.log", maxBytes=1e8,backupCount=5, )
+fh = logging.handlers.RotatingFileHandler("./log/mwatrigger.log", maxBytes=1e8, backupCount=5, delay=True)
 fh.setFormatter(formatter)
 fh.setLevel(logging.INFO)
 logger.addHandler(fh)
 
+### use orjson for (de)serialization if it is installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def _json_loads(data):
+    if orjson is not None: return orjson.loads(data)
+    return json.loads(data)
+
+def _json_dumps(obj):
+    """serialize obj to compact json bytes"""
+    if orjson is not None: return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":")).encode()
+
+def _load_json_file(path):
+    with open(os.path.expanduser(path), "rb") as fp:
+        return _json_loads(fp.read())
 
 class MWATrigger:
     """
@@ -49,6 +74,8 @@ class MWATrigger:
     MWA_TRIGGER_KEY_PATH = "~/.config/mwa_trigger_key.json"
     MWA_TRIGGER_ENDPOINT = "http://mro.mwa128t.org/trigger"
     MWA_TRIGGER_DEFAULT_PARAM = "./trigger_mwa_config.json"
+    ### parameters that change from trigger to trigger, all others are encoded once
+    MWA_TRIGGER_DYNAMIC_PARAM = ("ra", "dec", "obsname", "groupid")
 
     def __init__(self, trigtype="triggerobs", project_id=None, dryrun=True, **kwargs):
         """
@@ -61,6 +88,7 @@ class MWATrigger:
         **kwargs: keyword arguments passed to api endpoint
         """
         self.trigtype = trigtype
+        self._base_url = f"{self.MWA_TRIGGER_ENDPOINT}/{self.trigtype}"
         if project_id is None: 
             raise ValueError("project_id not found in the parameter list... please specify it and try again...")
         self.project_id = project_id
@@ -70,97 +98,183 @@ class MWATrigger:
 
         ### this is used for updating secure_key from env
         self._load_secure_key()
-        self.trigger_response_list = []
+        self._encode_static_params()
+        # only keep the most recent responses, all of them are dumped to ./log/triggers anyway
+        self.trigger_response_list = deque(maxlen=64)
+
+        ### persistent session so that the connection to the trigger service is reused
+        self._session = self._init_session()
+        ### worker threads for issuing independent requests concurrently
+        self._pool = ThreadPoolExecutor(max_workers=2)
+        ### cache for mwa status - {obstime: (monotonic time, (array_ready, corr_ready))}
+        self._ready_ttl = 2.0
+        self._ready_cache = {}
+        ### headers/cookies/auth are resolved once, only the url is updated for each trigger
+        self._trigger_request = self._session.prepare_request(requests.Request("POST", self._base_url))
+
+    def _init_session(self,):
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=4, pool_maxsize=10,
+            max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[502, 503, 504]),
+        )
+        # the retry/pooling policy only applies to the mwa trigger service
+        mwahost = urlsplit(self.MWA_TRIGGER_ENDPOINT)
+        session.mount(f"{mwahost.scheme}://{mwahost.netloc}/", adapter)
+        return session
+
+    def close(self,):
+        self._pool.shutdown(wait=True)
+        self._session.close()
+
+    @classmethod
+    @lru_cache(maxsize=4)
+    def _get_default_params(cls,):
+        """
+        default parameters for all projects, loaded once per class
+        call MWATrigger._get_default_params.cache_clear() to reload
+        """
+        return _load_json_file(cls.MWA_TRIGGER_DEFAULT_PARAM)
+
+    @classmethod
+    @lru_cache(maxsize=4)
+    def _get_secure_keys(cls,):
+        """
+        secure keys for all projects, loaded once per class
+        call MWATrigger._get_secure_keys.cache_clear() to reload
+        """
+        return _load_json_file(cls.MWA_TRIGGER_KEY_PATH)
 
     def _load_default_params(self,):
-        with open(self.MWA_TRIGGER_DEFAULT_PARAM) as fp:
-            default_params = json.load(fp)
+        default_params = self._get_default_params()
+        # copy the cached parameters as self.params will be updated later
         if self.project_id in default_params:
-            self.params = default_params[self.project_id]
+            self.params = dict(default_params[self.project_id])
         else:
-            self.params = default_params["default"]
+            self.params = dict(default_params["default"])
         self.params["project_id"] = self.project_id
 
     def update_default_params(self, **kwargs):
-        logger.info(f"updating default trigger parameter - {list(kwargs)}...")
+        logger.info("updating default trigger parameter - %s...", list(kwargs))
         self.params.update(kwargs)
+        self._encode_static_params()
+
+    def _encode_static_params(self,):
+        static_params = {
+            k: v for k, v in self.params.items()
+            if k not in self.MWA_TRIGGER_DYNAMIC_PARAM
+        }
+        self._static_keys = frozenset(static_params)
+        self._static_querystr = self._urlencode(static_params)
 
     def _load_secure_key(self,):
         # load secure key from ~/.config/mwa_trigger_key.json
         if "secure_key" in self.params:
-            logger.warning(f"secure_key found in the parameter list... please remove it and put it in {self.MWA_TRIGGER_KEY_PATH}")
-        with open(os.path.expanduser(self.MWA_TRIGGER_KEY_PATH)) as fp:
-            keys = json.load(fp)
+            logger.warning("secure_key found in the parameter list... please remove it and put it in %s", self.MWA_TRIGGER_KEY_PATH)
+        keys = self._get_secure_keys()
         self.params.update({"secure_key": keys[self.params["project_id"]]})
-        logger.info(f"get secure_key for project {self.params['project_id']} successfully...")
+        logger.info("get secure_key for project %s successfully...", self.params['project_id'])
 
     def check_array_ready(self, obstime=60):
         """
         check whether mwa can be interrupted by the given project
         """
-        checklink = f"http://mro.mwa128t.org/trigger/busy?project_id={self.project_id}&obstime={obstime}"
+        checklink = f"{self.MWA_TRIGGER_ENDPOINT}/busy"
         try:
-            response = requests.get(checklink)
+            response = self._session.get(
+                checklink, params=dict(project_id=self.project_id, obstime=obstime), timeout=(5, 30),
+            )
             response.raise_for_status()
         except Exception as error:
-            logger.error(f"cannot get correlator status... - {error}")
+            logger.error("cannot get correlator status... - %s", error)
             return None
         
-        busy = response.json()
+        busy = _json_loads(response.content)
         return not busy
 
     def check_corr_ready(self, ):
         """
         check whether correlator is in oversampling mode or critical sampling mode
         """
-        checklink = "http://mro.mwa128t.org/trigger/cstate"
+        checklink = f"{self.MWA_TRIGGER_ENDPOINT}/cstate"
         try: 
-            response = requests.get(checklink)
+            response = self._session.get(checklink, timeout=(5, 30))
             response.raise_for_status()
         except Exception as error:
-            logger.error(f"cannot get correlator status... - {error}")
+            logger.error("cannot get correlator status... - %s", error)
             return None 
         
-        healthy, oversampling = response.json()
+        healthy, oversampling = _json_loads(response.content)
         return not oversampling
 
-    def trigger(self, storeresponse=True, **kwargs):
-        trigger_data = self.params.copy()
-        trigger_data.update(kwargs)
+    def check_mwa_ready(self, obstime=60):
+        """
+        check array and correlator status concurrently,
+        return a tuple of (array_ready, corr_ready), the status is reused for self._ready_ttl seconds
+        """
+        now = time.monotonic()
+        cachetime, ready = self._ready_cache.get(obstime, (0.0, None))
+        if ready is not None and now - cachetime < self._ready_ttl:
+            return ready
+        array_future = self._pool.submit(self.check_array_ready, obstime=obstime)
+        corr_ready = self.check_corr_ready()
+        ready = (array_future.result(), corr_ready)
+        # do not cache failed queries
+        if None not in ready: self._ready_cache[obstime] = (now, ready)
+        return ready
+
+    @staticmethod
+    def _urlencode(data):
+        # same as quoting each value with urllib.parse.quote, i.e., space as %20 (not +)
+        return urlencode(data, doseq=True, safe="/", quote_via=quote)
+
+    def _build_querystr(self, **kwargs):
+        if not self._static_keys.isdisjoint(kwargs):
+            # some static parameters are overwritten - encode everything
+            trigger_data = self.params.copy()
+            trigger_data.update(kwargs)
+            return self._urlencode(trigger_data)
+        dynamic_data = {k: self.params[k] for k in self.MWA_TRIGGER_DYNAMIC_PARAM if k in self.params}
+        dynamic_data.update(kwargs)
+        if not dynamic_data: return self._static_querystr
+        return f"{self._static_querystr}&{self._urlencode(dynamic_data)}"
+
+    def _write_response_json(self, trigger_id, response_json):
+        logfolder = "./log/triggers"
+        try:
+            os.makedirs(logfolder, exist_ok=True)
+            with open(f"{logfolder}/{trigger_id}.response.json", "wb") as fp:
+                logger.info("dumping response json to %s/%s.response.json", logfolder, trigger_id)
+                fp.write(_json_dumps(response_json))
+        except OSError as error:
+            logger.error("cannot dump response json for trigger %s - %s", trigger_id, error)
 
+    def trigger(self, storeresponse=True, **kwargs):
         # I have no idea why requests.post(url, json=data) does not work
         # I will form a query string instead...
-        # querystr = "&".join([f"{k}={urllib.parse.quote(v)}" for k, v in trigger_data.items()])
-        querylst = []
-        for k, v in trigger_data.items():
-            if isinstance(v, str): querylst.append(f"{k}={urllib.parse.quote(v)}")
-            else: querylst.append(f"{k}={v}")
-        querystr = "&".join(querylst)
-        url = f"{self.MWA_TRIGGER_ENDPOINT}/{self.trigtype}?{querystr}"
-        logger.info(f"trigger the observation with following url - {url}")
+        querystr = self._build_querystr(**kwargs)
+        url = f"{self._base_url}?{querystr}"
+        logger.info("trigger the observation with following url - %s", url)
         if self.dryrun:
-            logger.info(f"dryrun... will not create a trigger...")
+            logger.info("dryrun... will not create a trigger...")
             return None
         try:
-            response = requests.post(url, )
+            request = self._trigger_request.copy()
+            request.prepare_url(url, None)
+            response = self._session.send(request, timeout=(5, 30))
             response.raise_for_status()
             ### if success is False, need to retrigger...
-            response_json = response.json()
+            response_json = _json_loads(response.content)
             ### save response to log folder...
-            if storeresponse:
-                trigger_id = response_json["trigger_id"]
-                logfolder = f"./log/triggers"
-                os.makedirs(logfolder, exist_ok=True)
-                with open(f"{logfolder}/{trigger_id}.response.json", "w") as fp:
-                    logger.info(f"dumping response json to {logfolder}/{trigger_id}.response.json")
-                    json.dump(response_json, fp, indent=2)
+            if storeresponse: # in the background so that we can return straight away
+                self._pool.submit(self._write_response_json, response_json["trigger_id"], response_json)
             self.trigger_response_list.append(response_json)
             success = response_json["success"]
-            if success: return response.json()
-            logger.warning(f"trigger is not successful... please check...")
+            if success: return response_json
+            logger.warning("trigger is not successful... please check...")
             return None
         except requests.exceptions.RequestException as error:
-            logger.info(f"error triggering mwa telescope - {error}")
+            logger.info("error triggering mwa telescope - %s", error)
             return None
         
 ####### this is for the database
@@ -169,8 +283,20 @@ class MWATriggerDB:
         self.dbfname = dbfname
         self._init_db()
         
+    SQLITE_PRAGMAS = (
+        "journal_mode=WAL", "synchronous=NORMAL", "temp_store=MEMORY", "busy_timeout=5000",
+        "mmap_size=268435456", "cache_size=-20000", "wal_autocheckpoint=1000",
+    )
+
     def _init_db(self):
-        self.conn = sqlite3.connect(self.dbfname)
+        ### self.conn is the (only) read-write connection
+        # isolation_level=None - no implicit transactions, batch() issues BEGIN/COMMIT itself
+        self.conn = sqlite3.connect(
+            self.dbfname, isolation_level=None, check_same_thread=False, timeout=5.0,
+            cached_statements=128,
+        )
+        for pragma in self.SQLITE_PRAGMAS:
+            self.conn.execute(f"PRAGMA {pragma}")
         cursor = self.conn.cursor()
         ### this is for observation table
         cursor.execute('''
@@ -180,17 +306,55 @@ CREATE TABLE IF NOT EXISTS mwatrigger (
     groupid INTEGER,
     calobs INTEGER
 )''')
-        self.conn.commit()
         ### this is for calibration table
         cursor.execute('''
 CREATE TABLE IF NOT EXISTS mwacal (
     calgroupid INTEGER PRIMARY KEY,
     time REAL
 )''')
-        self.conn.commit()
-        
+        # range lookup on time in query_cal_record
+        cursor.execute("CREATE INDEX IF NOT EXISTS mwacal_time_idx ON mwacal(time)")
         cursor.close()
 
+        ### read-only connection for the queries - it is never blocked by the writer in WAL mode
+        if self.dbfname in (":memory:", ""): # private database, nothing else can open it
+            self.rconn = self.conn
+        else:
+            dburi = pathlib.Path(self.dbfname).resolve().as_uri()
+            self.rconn = sqlite3.connect(
+                f"{dburi}?mode=ro", uri=True, isolation_level=None, check_same_thread=False, timeout=5.0,
+                cached_statements=128,
+            )
+
+        ### parameterized statements used by the helpers below
+        self._sql_insert = """INSERT INTO mwatrigger (SBID, Time, groupid, calobs) 
+VALUES (?, ?, ?, ?) ON CONFLICT(SBID) DO NOTHING"""
+        self._sql_update_all = """UPDATE mwatrigger 
+SET Time = COALESCE(?, Time), groupid = COALESCE(?, groupid), calobs = COALESCE(?, calobs)
+WHERE SBID = ?"""
+        self._sql_query = """SELECT Time, groupid, calobs FROM mwatrigger WHERE SBID = ?"""
+        self._sql_query_cal = """SELECT 1 FROM mwacal WHERE time > ? LIMIT 1"""
+
+    @contextmanager
+    def batch(self,):
+        """
+        group several inserts/updates into a single transaction (i.e., one commit),
+        statements outside a batch are committed on their own (autocommit),
+        the helpers re-raise sqlite3 errors inside a batch so that everything is rolled back,
+        errors are re-raised without logging - the caller of the batch logs them
+        """
+        if self.conn.in_transaction: # already in a batch - let the outer one commit
+            yield
+            return
+        # take the write lock up front so the commit can not fail with SQLITE_BUSY halfway
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
     def insert_record(self, recordlst=None, **kwargs):
         """
         insert a single record either with a list or tuple of single record,
@@ -200,25 +364,29 @@ CREATE TABLE IF NOT EXISTS mwacal (
             recordlst = self._convert_insert_kwargs(kwargs)
         if recordlst is None:
             return # do nothing if no recordlst or sbid provided
+        self.insert_records([recordlst])
+
+    def insert_records(self, records):
+        """
+        insert multiple records (list of lists/tuples) in a single transaction
+        """
         ### now we can update the database...
         try:
-            cursor = self.conn.cursor()
-            logger.info(f"insert record with following value - {recordlst}")
-            cursor.execute("""INSERT INTO mwatrigger (SBID, Time, groupid, calobs) 
-VALUES (?, ?, ?, ?)""", recordlst)
-            self.conn.commit()
-            cursor.close()
-
-        except Exception as error:
-            logger.error(f"cannot insert thie record! - {error}")
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("insert %s record(s) with following values - %s", len(records), records)
+            with self.batch():
+                self.conn.executemany(self._sql_insert, records)
+        except sqlite3.Error as error:
+            if self.conn.in_transaction: raise # let the outer batch rollback, its caller logs it
+            logger.error("cannot insert these records! - %s", error)
     
     def _convert_insert_kwargs(self, argdict):
         """
         convert kwargs into recordlst
         """
-        args = ["sbid", "time", "groupid", "calobs"]
         if "sbid" not in argdict: return None
-        return [argdict.get(arg) for arg in args]
+        get = argdict.get
+        return (argdict["sbid"], get("time"), get("groupid"), get("calobs"))
 
     def insert_cal_record(self, recordlst=None, **kwargs):
         """
@@ -230,62 +398,46 @@ VALUES (?, ?, ?, ?)""", recordlst)
             return
         
         try:
-            cursor = self.conn.cursor()
-            logger.info(f"insert record with following value - {recordlst}")
-            cursor.execute("""INSERT INTO mwacal (calgroupid, time) 
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("insert record with following value - %s", recordlst)
+            self.conn.execute("""INSERT INTO mwacal (calgroupid, time) 
 VALUES (?, ?)""", recordlst)
-            self.conn.commit()
-            cursor.close()
 
-        except Exception as error:
-            logger.error(f"cannot insert this record to mwacal! - {error}")
+        except sqlite3.Error as error:
+            if self.conn.in_transaction: raise # let the batch rollback, its caller logs it
+            logger.error("cannot insert this record to mwacal! - %s", error)
 
     def _convert_insert_cal_kwargs(self, argdict):
         """
         convert kwargs into recordlst
         """
-        args = ["calgroupid", "time"]
         if "calgroupid" not in argdict: return None
-        return [argdict.get(arg) for arg in args]
+        return (argdict["calgroupid"], argdict.get("time"))
     
-    def update_record(self, sbid, recordlst=None, **kwargs):
-        if recordlst is None:
-            updates, recordlst = self._convert_update_kwargs(sbid, kwargs)
-        else:
-            updates = ["time = ?", "groupid = ?", "calobs = ?"]
-            recordlst.append(sbid) # add sbid...
-        if recordlst is None: return # nothing happened...
+    def update_record(self, sbid, time=None, groupid=None, calobs=None):
+        """
+        update time, groupid and/or calobs for a given sbid in a single statement,
+        None values leave the stored value unchanged
+        """
         try:
-            cursor = self.conn.cursor()
-            cursor.execute(f"""UPDATE mwatrigger SET {", ".join(updates)}
-WHERE SBID = ?""", recordlst)
-            logger.info(f"update record for {sbid} with following values - {recordlst}")
-            self.conn.commit()
-            cursor.close()
-        except Exception as error:
-            logger.error(f"cannot update this record! - {error}")
-
-    def _convert_update_kwargs(self, sbid, argdict):
-        args = ["time", "groupid", "calobs"]
-        updates = [f"{k} = ?" for k in args if k in argdict]
-        if len(updates) == 0: return None, None
-        values = [argdict[k] for k in args if k in argdict]
-        values.append(sbid) # add sbid as we need to specify sbid = ? in the query
-        return updates, values
+            self.conn.execute(self._sql_update_all, (time, groupid, calobs, sbid))
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("update record for %s with following values - time: %s, groupid: %s, calobs: %s", sbid, time, groupid, calobs)
+        except sqlite3.Error as error:
+            if self.conn.in_transaction: raise # let the batch rollback, its caller logs it
+            logger.error("cannot update this record! - %s", error)
 
     def query_record(self, sbid):
         try:
-            cursor = self.conn.cursor()
-            cursor.execute("""SELECT * FROM mwatrigger WHERE SBID = ?""", (sbid,))
-            record = cursor.fetchone()
+            record = self.rconn.execute(self._sql_query, (sbid,)).fetchone()
 
             if record:
-                _, time, groupid, calobs = record
+                time, groupid, calobs = record
                 return dict(time=time, groupid=groupid, calobs=calobs)
             else:
                 return None
-        except Exception as error:
-            logger.error(f"cannot query this record! - {error}")
+        except sqlite3.Error as error:
+            logger.error("cannot query this record! - %s", error)
     
     def query_cal_record(self, time, window=1/24):
         """
@@ -293,16 +445,15 @@ WHERE SBID = ?""", recordlst)
         return True if there is a calibration record
         """
         try:
-            cursor = self.conn.cursor()
-            cursor.execute(f"""SELECT * FROM mwacal WHERE TIME > {time - window}""")
-            record = cursor.fetchone()
+            record = self.rconn.execute(self._sql_query_cal, (time - window,)).fetchone()
 
             if record: return True
             return False
-        except Exception as error:
-            logger.error(f"cannot query this record from mwacal... - {error}")
+        except sqlite3.Error as error:
+            logger.error("cannot query this record from mwacal... - %s", error)
 
     def close(self,):
+        if self.rconn is not self.conn: self.rconn.close()
         self.conn.close()
 ######### end of the database...
 
@@ -310,6 +461,13 @@ class ASKAPMWATrigger:
     """
     this class is used for triggering MWA based on ASKAP observation
     """
+    ### gps time = unix time - gps epoch (1980-01-06 00:00:00 UTC) in unix time + leap seconds since then
+    GPS_UNIX_EPOCH = 315964800
+    GPS_LEAP_SECONDS = 18
+    USE_ASTROPY_GPS_TIME = False # set to True if there is a new leap second
+    ### mjd = unix time in days + mjd of the unix epoch (1970-01-01)
+    MJD_UNIX_EPOCH = 40587
+
     def __init__(self, sbid, project_id=None, dryrun=True, ):
         self.sbid = sbid
         self.schedblock = ASKAPSchedBlock(sbid=self.sbid)
@@ -317,6 +475,14 @@ class ASKAPMWATrigger:
         self.mwatrigger = MWATrigger(project_id=project_id, dryrun=dryrun)
         self.mwatriggerdb = MWATriggerDB(dbfname="trigger.db")
 
+        ### cache for sbid status - (monotonic time, status value)
+        self._status_ttl = 5.0
+        self._status_cache = (0.0, None)
+
+        ### source coordinate and the scan it belongs to
+        self.coord = (None, None)
+        self._last_scan = None
+
         ### initiate database...
         self._init_db_record()
         # load calibrator list...
@@ -326,7 +492,7 @@ class ASKAPMWATrigger:
         self.mwasite = EarthLocation.of_site("mwa")
         calpath = os.path.join(os.path.dirname(__file__), "mwa_calibrator_coord.csv")
         if not os.path.exists(calpath):
-            logger.warning(f"no mwa calibrator table found... {calpath}")
+            logger.warning("no mwa calibrator table found... %s", calpath)
             self.calnames = None
             self.calcoords = None
             return
@@ -345,46 +511,100 @@ class ASKAPMWATrigger:
 
     @property
     def sbid_status(self,):
-        return self.schedblock.status.value
+        # reuse the status if it was queried within the last self._status_ttl seconds
+        now = time.monotonic()
+        cachetime, status = self._status_cache
+        if status is not None and now - cachetime < self._status_ttl:
+            return status
+        status = self.schedblock.status.value
+        self._status_cache = (now, status)
+        return status
+
+    def _invalidate_sbid_status(self,):
+        self._status_cache = (0.0, None)
+
+    def _wait_for_status(self, pred, start=1.0, cap=30.0):
+        """
+        poll sbid status with an exponential backoff until pred(status) is True,
+        the waiting time is reset to `start` whenever the status changes
+        """
+        wait = start
+        status = self.sbid_status
+        while not pred(status):
+            time.sleep(wait)
+            self._invalidate_sbid_status() # we have waited, always get a fresh status
+            newstatus = self.sbid_status
+            if newstatus != status: wait = start
+            else: wait = min(cap, wait * 1.5)
+            status = newstatus
+        return status
+
+    @staticmethod
+    def _backoff(attempt, start=5.0, cap=60.0):
+        """
+        waiting time for the `attempt`-th retry, doubled every attempt and capped at `cap`
+        """
+        return min(cap, start * 2 ** min(attempt, 16))
+
+    def _sleep_while_executing(self, seconds, interval=10.0):
+        """
+        sleep for `seconds` while checking sbid status every `interval` seconds,
+        return False early if the sbid has finished, otherwise return True
+        """
+        end = time.monotonic() + seconds
+        remain = seconds
+        while remain > 0:
+            time.sleep(min(interval, remain))
+            if self.sbid_status > 3:
+                logger.info("SB%s has finished during the wait...", self.sbid)
+                return False
+            remain = end - time.monotonic()
+        return True
     
     @property
     def mwa_status(self,):
         # check whether the array can be interrupted
-        array_ready = self.mwatrigger.check_array_ready()
-        corr_ready = self.mwatrigger.check_corr_ready()
-        logger.info(f"mwa array ready: {array_ready}; correlator ready: {corr_ready}")
+        array_ready, corr_ready = self.mwatrigger.check_mwa_ready()
+        logger.info("mwa array ready: %s; correlator ready: %s", array_ready, corr_ready)
         return array_ready and corr_ready
     
     def running(self,):
         """
         a parameter to check whether a given sbid is running
         """
-        if self.schedblock.status.value == 3:
+        status = self.sbid_status
+        if status == 3:
             return True # running now
-        elif self.schedblock.status.value < 3:
+        elif status < 3:
             return None # to be scheduled
         return False
 
     def get_schedblock_source(self,):
         try:
             self.schedblock._refresh_schedblock() # refresh to get new obsparam and obsvar
-            self.schedblock.get_sources_coord()
+            self._invalidate_sbid_status() # and the status as well
+            self.schedblock.get_scan_source()
+            maxscan = max(self.schedblock.scan_src_match.keys())
+            if maxscan == self._last_scan and self.coord != (None, None):
+                return # still the same scan, no need to parse the coordinates again
+            self.schedblock.get_sources_coord(rescan=False) # scans have just been read above
             srclst = self.schedblock.source_coord
             if len(srclst) == 1:
                 self.coord = srclst[list(srclst)[0]]
             else:
-                logger.warning(f"{len(srclst)} sources found... will proceed with the last scan...")
-                maxscan = max(self.schedblock.scan_src_match.keys())
+                logger.warning("%s sources found... will proceed with the last scan...", len(srclst))
                 scansrc = self.schedblock.scan_src_match[maxscan]
-                logger.info(f"scan number {maxscan} source name {scansrc}...")
+                logger.info("scan number %s source name %s...", maxscan, scansrc)
                 self.coord = srclst[scansrc]
-            logger.info(f"SB{self.sbid} is targeting {self.coord}...")
+            logger.info("SB%s is targeting %s...", self.sbid, self.coord)
 
             self.mwatrigger.update_default_params(ra=self.coord[0], dec=self.coord[1])
+            self._last_scan = maxscan
         except Exception as error:
-            logger.warning(f"cannot get antenna pointing for {self.sbid}...")
-            logger.warning(f"error msg - {error}")
+            logger.warning("cannot get antenna pointing for %s...", self.sbid)
+            logger.warning("error msg - %s", error)
             self.coord = (None, None)
+            self._last_scan = None
 
     ### parse trigger response
     def _get_trigger_obsids(self, response, ):
@@ -394,18 +614,29 @@ class ASKAPMWATrigger:
         if len(obsid_list) == 0: return [self._get_current_gps_time()]
         return obsid_list
 
-    def _get_current_gps_time(self,):
-        now = Time(datetime.now())
-        return int(now.gps)
+    def _get_current_gps_time(self, now=None):
+        """
+        gps time for the unix timestamp `now` (current time if not given)
+        """
+        if now is None: now = time.time()
+        if self.USE_ASTROPY_GPS_TIME: return self._get_current_gps_time_astropy(now)
+        return int(now - self.GPS_UNIX_EPOCH + self.GPS_LEAP_SECONDS)
+
+    def _get_current_gps_time_astropy(self, now):
+        from astropy.time import Time
+        return int(Time(now, format="unix").gps)
 
-    def _get_current_mjd_time(self,):
-        now = Time(datetime.now())
-        return now.mjd
+    def _get_current_mjd_time(self, now=None):
+        """
+        mjd (utc) for the unix timestamp `now` (current time if not given)
+        """
+        if now is None: now = time.time()
+        return now / 86400 + self.MJD_UNIX_EPOCH
     
     def trigger_mwa(self, **kwargs):
         if "ra" not in self.mwatrigger.params:
             logger.info("no ra/dec information found... will not trigger any observation...")
-            logger.info(f"please check whether SB{self.sbid} is a science observation - template: {self.schedblock.template}")
+            logger.info("please check whether SB%s is a science observation - template: %s", self.sbid, self.schedblock.template)
             return None
         field = self.schedblock.alias
         if field: kwargs.update(dict(obsname=field)) # update alias...
@@ -420,10 +651,11 @@ class ASKAPMWATrigger:
         """
         function to select calibrator based on the time
         """
-        utctimenow = Time(datetime.now(timezone.utc))
-        logger.info(f"selecting calibrator - UTC Time now {utctimenow}")
+        from astropy.time import Time
+        utctimenow = Time.now()
+        logger.info("selecting calibrator - UTC Time now %s", utctimenow)
         if self.calnames is None:
-            logger.info(f"no calibrator list loaded... abort...")
+            logger.info("no calibrator list loaded... abort...")
             return None
         calcoords_altaz = self.calcoords.transform_to(
             AltAz(obstime=utctimenow, location=self.mwasite)
@@ -432,7 +664,7 @@ class ASKAPMWATrigger:
         ### choose the one with maximum altitude
         calidx = calalts.argmax()
         calselect = self.calnames[calidx]
-        logger.info(f"Select {calselect} with an elevation angle of {calalts[calidx]:.2f}...")
+        logger.info("Select %s with an elevation angle of %.2f...", calselect, calalts[calidx])
         return calselect
 
     def trigger_mwa_cal(
@@ -446,10 +678,10 @@ class ASKAPMWATrigger:
         mjdnow = self._get_current_mjd_time()
         calexist = self.mwatriggerdb.query_cal_record(mjdnow, window=calsearchwindow)
         if calexist: # there is already a calibration - do nothing
-            logger.info(f"calibration found in the database...")
+            logger.info("calibration found in the database...")
             self.mwatriggerdb.update_record(sbid=self.sbid, calobs=True)
             if not forcecal: return None 
-            logger.info(f"forcecal set to True - proceed to ask for a calibration anyway...")
+            logger.info("forcecal set to True - proceed to ask for a calibration anyway...")
 
         if "ra" not in self.mwatrigger.params:
             logger.info("no ra/dec information found... will use zenith for fake run for calibrator...")
@@ -465,27 +697,42 @@ class ASKAPMWATrigger:
         if not autocal:
             calselect = self._select_cal()
             if calselect is not None:
-                logger.info(f"updating trigger data - calibrator to {calselect}")
+                logger.info("updating trigger data - calibrator to %s", calselect)
                 kwargs.update(dict(calibrator=calselect))
 
         field = self.schedblock.alias
         if field: kwargs.update(dict(obsname=f"{field}_cal")) # update alias...
         response = self.mwatrigger.trigger(**kwargs)
         if response is not None or self.dryrun: # update the database if it is a dryrun...
-            self.mwatriggerdb.update_record(sbid=self.sbid, calobs=True)
             if self.groupid is None:
                 self.groupid = self._get_trigger_obsids(response)[0]
-                self.mwatriggerdb.update_record(sbid=self.sbid, groupid=self.groupid)
-            ### update calibration database
-            self.mwatriggerdb.insert_cal_record(calgroupid=self._get_current_gps_time(), time=self._get_current_mjd_time())
+            ### one transaction for both mwatrigger and mwacal tables
+            try:
+                with self.mwatriggerdb.batch():
+                    self.mwatriggerdb.update_record(sbid=self.sbid, groupid=self.groupid, calobs=True)
+                    ### update calibration database
+                    now = time.time() # use the same time for both gps and mjd
+                    self.mwatriggerdb.insert_cal_record(calgroupid=self._get_current_gps_time(now), time=self._get_current_mjd_time(now))
+            except sqlite3.Error as error:
+                logger.error("cannot update the database for the calibrator observation... - %s", error)
         return response
 
+    def close(self,):
+        self.mwatriggerdb.close()
+        self.mwatrigger.close()
+
     def run(self, buffertime=30, calfirst=True, calexptime=120, **kwargs):
+        try:
+            return self._run(buffertime=buffertime, calfirst=calfirst, calexptime=calexptime, **kwargs)
+        finally:
+            self.close()
+
+    def _run(self, buffertime=30, calfirst=True, calexptime=120, **kwargs):
         status = self.sbid_status
-        logger.info(f"SB{self.sbid} current status - {status}...")
+        logger.info("SB%s current status - %s...", self.sbid, status)
 
         if status > 3:
-            logger.info(f"SB{self.sbid} has already finished... abort...")
+            logger.info("SB%s has already finished... abort...", self.sbid)
             return
         
         trigger_status = self.mwatriggerdb.query_record(sbid=self.sbid)
@@ -496,71 +743,89 @@ class ASKAPMWATrigger:
         if calfirst and not calstatus:
             ### again you need to make sure array in a good mode to get the calibration...
             mwastatus = self.mwa_status
-            logger.info(f"SB{self.sbid} current status - {status}...; MWA current status - {mwastatus}")
+            logger.info("SB%s current status - %s...; MWA current status - %s", self.sbid, status, mwastatus)
+            attempt = 0
             while not mwastatus:
-                logger.info(f"mwa is current unable to perform this observation...")
-                time.sleep(5) # wait every 5s...
+                logger.info("mwa is current unable to perform this observation...")
+                time.sleep(self._backoff(attempt)) # wait 5s, 10s, 20s... up to 60s
                 mwastatus = self.mwa_status
-                if self.sbid_status > 3:
+                newstatus = self.sbid_status
+                if newstatus > 3:
                     logger.info("waited mwa for too long - observation has already finished...")
-                    self.mwatriggerdb.close()
                     return None
+                attempt = 0 if newstatus != status else attempt + 1
+                status = newstatus
             #######################
             logger.info("scheduling calibrator observation...")
             # note - we have already implement no cal logic in the below function
             # i.e., no cal trigger if there is already a calibration within 6 hours
+            self._invalidate_sbid_status()
             response = self.trigger_mwa_cal(calexptime=calexptime, **kwargs)
             if response is not None or self.dryrun:
-                time.sleep(calexptime + 8) # wait for the calibrator observation to be finished...
+                # wait for the calibrator observation to be finished...
+                self._sleep_while_executing(calexptime + 8)
         
         status = self.sbid_status
         mwastatus = self.mwa_status
-        logger.info(f"SB{self.sbid} current status - {status}...; MWA current status - {mwastatus}")
+        logger.info("SB%s current status - %s...; MWA current status - %s", self.sbid, status, mwastatus)
+        attempt = 0 # backoff for mwa not ready
         while status < 3 or (status == 3 and not mwastatus):
             # it will go into this while loop if
             # (1) this sbid has not been executed;
             # (2) this sbid is ongoing, but mwa is not ready for observation
             if status < 3:
-                logger.info(f"SB{self.sbid} has not been executed...")
+                logger.info("SB%s has not been executed...", self.sbid)
+                status = self._wait_for_status(lambda s: s >= 3)
             else:
-                logger.info(f"mwa array is not ready for observation...")
-            time.sleep(10)
-            status = self.sbid_status
+                logger.info("mwa array is not ready for observation...")
+                time.sleep(self._backoff(attempt, start=10.0))
+                newstatus = self.sbid_status
+                attempt = 0 if newstatus != status else attempt + 1
+                status = newstatus
             mwastatus = self.mwa_status
 
         exptime = self.mwatrigger.params.get("exptime")
+        retrywait = 1.0 # backoff for failed triggers
+        attempt = 0 # backoff for mwa not ready
         while status == 3:
             mwastatus = self.mwa_status
             if not mwastatus: # array is not ready...
+                time.sleep(self._backoff(attempt))
+                attempt += 1
                 status = self.sbid_status
-                time.sleep(5)
                 continue
+            attempt = 0
 
             self.get_schedblock_source()
             ### as there is calwindow parameter in trigger_mwa_cal, therefore I just add it here
+            self._invalidate_sbid_status()
             response = self.trigger_mwa_cal(calexptime=calexptime, **kwargs)
             if response is not None or self.dryrun:
-                time.sleep(calexptime + 8)
+                if not self._sleep_while_executing(calexptime + 8):
+                    break # no need to trigger the observation if the sbid has finished
             ### now trigger the observation itself...
+            self._invalidate_sbid_status()
             response = self.trigger_mwa(**kwargs)
             if response is not None or self.dryrun:
+                retrywait = 1.0
                 time.sleep(exptime - buffertime)
             else:
                 # something goes wrong - either trigger service not working or something else
-                time.sleep(5) # stop for a while to check status...
+                time.sleep(retrywait) # stop for a while to check status...
+                retrywait = min(30.0, retrywait * 1.5)
             status = self.sbid_status
-        logger.info(f"SB{self.sbid} observation finishes...")
+        logger.info("SB%s observation finishes...", self.sbid)
 
         # trigger_status = self.mwatriggerdb.query_record(sbid=self.sbid)
         # calstatus = trigger_status["calobs"]
         ### trigger a calibration at the end no matter what
         logger.info("scheduling calibrator observation...")
+        self._invalidate_sbid_status()
         self.trigger_mwa_cal(calexptime=calexptime, **kwargs)
-        logger.info(f"waiting for the observation to be finished... {calexptime}s...")
+        logger.info("waiting for the observation to be finished... %ss...", calexptime)
         time.sleep(calexptime) # wait for the calibrator observation to be finished...
         
-        logger.info(f"MWA triggered observation done - SB{self.sbid}")
-        self.mwatriggerdb.close()
+        logger.info("MWA triggered observation done - SB%s", self.sbid)
         
 if __name__ == "__main__":
     from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
@@ -570,5 +835,10 @@ if __name__ == "__main__":
     parser.add_argument("--dryrun", action="store_true", help="whether run as a dry run or not", default=False)
     values = parser.parse_args()
 
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', 
+        level=logging.INFO,
+    )
+
     trigger = ASKAPMWATrigger(sbid=values.sbid, project_id=values.pid, dryrun=values.dryrun, )
     trigger.run()
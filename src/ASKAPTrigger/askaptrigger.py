@@ -11,13 +11,16 @@ import re
 import os
 import sys
 import json
+import shutil
+import signal
 import subprocess
+import threading
+
+from ast import literal_eval
+from collections import defaultdict
+from functools import cached_property, lru_cache
 
 import logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', 
-    level=logging.INFO,
-)
 logger = logging.getLogger(__name__)
 
 import Ice
@@ -25,11 +28,22 @@ import IceStorm
 try:
     from askap.iceutils import get_service_object
 except:
-    logger.info(f"cannot load askap iceutils... only available for some modules...")
+    # warning - this is logged at import, before any entry point configures logging
+    logger.warning(f"cannot load askap iceutils... only available for some modules...")
 from aces.askapdata.schedblock import SchedulingBlock
 import askap.interfaces as iceint
 from askap.interfaces.schedblock import ObsState
 
+### ra and dec in field_direction, e.g., ['12:00:00.0', '-45:00:00', 'J2000']
+_FIELD_DIR_RE = re.compile(r"\[\s*([^,\]]+)\s*,\s*([^,\]]+)\s*,[^\]]*\]")
+### antenna names in schedblock.antennas, e.g., ['ant1', 'ant2']
+_ANT_RE = re.compile(r"[^\s,'\"\[\]]+")
+### scan number and antenna in obsvar keys, e.g., schedblock.scan000.target.ant1
+_SCAN_TARGET_RE = re.compile(r"^schedblock\.scan(\d{3})\.target\.(\w+)$")
+
+### executable for the tsp job, resolve it once rather than for every trigger
+_ASKAP_TRIGGER_MWA_BIN = shutil.which("askap_trigger_mwa") or "askap_trigger_mwa"
+
 class SBStateSubscriber(object):
     def __init__(self, monitor_impl=None):
         self.topic_name = "sbstatechange"
@@ -66,6 +80,26 @@ class SBStateSubscriber(object):
             raise
         self.adapter.activate()
 
+    def wait_for_shutdown(self, signals=(signal.SIGINT, signal.SIGTERM)):
+        """
+        block until one of `signals` is received or the communicator is shutdown elsewhere,
+        then unsubscribe from the topic, shutdown and destroy ice,
+        this needs to be called from the main thread (where the signal handlers are installed)
+        """
+        stopped = threading.Event()
+        def _handler(signum, frame):
+            logger.info(f"received {signal.Signals(signum).name}... shutting down...")
+            stopped.set()
+        for signum in signals:
+            signal.signal(signum, _handler)
+        while not stopped.wait(1.0) and not self.ice.isShutdown():
+            pass
+        try:
+            self.topic.unsubscribe(self.subscriber)
+        except Exception as error: # e.g., the communicator is already gone
+            logger.warning(f"cannot unsubscribe from {self.topic_name}... - {error}")
+        self.ice.shutdown()
+        self.ice.destroy()
 
     @staticmethod
     def _setup_communicator():
@@ -81,9 +115,16 @@ class SBStateSubscriber(object):
         return Ice.initialize(init)
     
 class ASKAPSchedBlock:
+
+    ### properties derived from obsparams/obsvar, these will be cleared once refreshed
+    _CACHED_PROPERTIES = (
+        "antennas", "corrmode", "template", "spw", "central_freq", "footprint",
+        "start_time", "sched_time", "weight_sched", "fcm_version",
+    )
     
     def __init__(self, sbid):
         self.sbid = sbid
+        self._fdir_cache = {} # field_direction string -> (ra, dec)
         self._refresh_schedblock()
 
     # get source field direction
@@ -94,22 +135,34 @@ class ASKAPSchedBlock:
         ### then try schedblock.src16.field_direction in obsvar
         elif f"schedblock.{src}.field_direction" in self.obsvar:
             field_direction_str = self.obsvar[f"schedblock.{src}.field_direction"]
-        return self.__parse_field_direction(field_direction_str)
+        ### sources can share the same field direction, no need to parse them again
+        if field_direction_str not in self._fdir_cache:
+            self._fdir_cache[field_direction_str] = self.__parse_field_direction(field_direction_str)
+        return self._fdir_cache[field_direction_str]
             
     def __parse_field_direction(self, field_direction_str):
         """parse field_direction_str"""
-        pattern = """\[(.*),(.*),.*\]"""
-        matched = re.findall(pattern, field_direction_str)
-        assert len(matched) == 1, f"find none or more matched pattern in {field_direction_str}"
+        matched = _FIELD_DIR_RE.search(field_direction_str)
+        assert matched is not None, f"find no matched pattern in {field_direction_str}"
         ### then further parse ra and dec value
-        ra_str, dec_str = matched[0]
+        ra_str, dec_str = matched.group(1), matched.group(2)
         ra_str = ra_str.replace("'", "").replace('"', "") # replace any possible " or '
         dec_str = dec_str.replace("'", "").replace('"', "")
+
+        if (":" not in ra_str) and (":" not in dec_str):
+            ### already in decimal degrees, no need to construct a SkyCoord
+            try: ra, dec = float(ra_str), float(dec_str)
+            except ValueError: pass # e.g., with units in the string, let SkyCoord handle it
+            else:
+                # SkyCoord rejects these, we should never point the telescope there
+                if not -90. <= dec <= 90.:
+                    raise ValueError(f"declination {dec} in {field_direction_str} is out of range [-90, 90]...")
+                return ra % 360., dec # ra wraps to [0, 360) as in SkyCoord
         
         if (":" in ra_str) and (":" in dec_str):
-            field_coord = SkyCoord(ra_str, dec_str, unit=(units.hourangle, units.degree))
+            field_coord = SkyCoord(ra_str, dec_str, unit=(units.hourangle, units.degree), frame="icrs")
         else:
-            field_coord = SkyCoord(ra_str, dec_str, unit=(units.degree, units.degree))
+            field_coord = SkyCoord(ra_str, dec_str, unit=(units.degree, units.degree), frame="icrs")
             
         return field_coord.ra.value, field_coord.dec.value
     
@@ -118,32 +171,44 @@ class ASKAPSchedBlock:
         retrieve scan and source pair based on the schedulingblock
         """
         refant = self.antennas[0]
+        scan_targets = self._get_scan_targets()
         scan_src_match = {}
         sources = []
-        for scan in range(100): # assume maximum scan number is 99
-            scanstr = f"{scan:0>3}"
-            scanantkey = f"schedblock.scan{scanstr}.target.{refant}"
-            if scanantkey in self.obsvar: 
-                src = self._find_scan_source(scan)
-                scan_src_match[scan] = src
-                if src not in sources: sources.append(src)
-            else: break
+        scan = 0
+        while refant in scan_targets.get(scan, ()): # scans are numbered continuously from 0
+            src = self._unique_source(scan_targets[scan].values())
+            scan_src_match[scan] = src
+            if src not in sources: sources.append(src)
+            scan += 1
         self.scan_src_match = scan_src_match
         self.sources = sources
-            
-    def _find_scan_source(self, scan):
-        # in self.obsvar under schedblock.scan000.target.ant1
-        scanstr = f"{scan:0>3}"
-        allsrc = [self.obsvar[f"schedblock.scan{scanstr}.target.{ant}"].strip() for ant in self.antennas]
-        unisrc = list(set(allsrc))
+
+    def _get_scan_targets(self):
+        """
+        collect target of each antenna for all scans with a single pass over scan keys in obsvar,
+        only antennas in schedblock.antennas are considered,
+        return a dictionary of {scan: {ant: src}}
+        """
+        antennas = frozenset(self.antennas)
+        scan_targets = defaultdict(dict)
+        for key in self._obsvar_scan_keys:
+            matched = _SCAN_TARGET_RE.match(key)
+            if matched is None or matched.group(2) not in antennas: continue
+            scan_targets[int(matched.group(1))][matched.group(2)] = sys.intern(self.obsvar[key].strip())
+        return scan_targets
+
+    @staticmethod
+    def _unique_source(allsrc):
+        unisrc = set(allsrc)
         assert len(unisrc) == 1, "cannot handle fly's eye mode..."
-        return unisrc[0]
+        return unisrc.pop()
         
-    def get_sources_coord(self, ):
+    def get_sources_coord(self, rescan=True):
         """
-        get source and direction pair
+        get source and direction pair,
+        set rescan to False to reuse the sources from the last get_scan_source call
         """
-        self.get_scan_source()
+        if rescan: self.get_scan_source()
         self.source_coord = {src:self._get_field_direction(src) for src in self.sources}
 
     def _refresh_schedblock(self,):
@@ -152,40 +217,46 @@ class ASKAPSchedBlock:
         
         ### get obsparams and obsvar
         if self.askap_schedblock is not None:
-            self.obsparams = self.askap_schedblock.get_parameters()
-            self.obsvar = self.askap_schedblock.get_variables()
-
-    @property
+            ### intern the keys, they are looked up again and again with the same literals
+            intern = sys.intern
+            self.obsparams = {intern(k): v for k, v in self.askap_schedblock.get_parameters().items()}
+            self.obsvar = {intern(k): v for k, v in self.askap_schedblock.get_variables().items()}
+            ### scan related keys, so that we do not go through the whole obsvar for scans
+            self._obsvar_scan_keys = [k for k in self.obsvar if k.startswith("schedblock.scan")]
+
+        ### drop cached properties so that they are derived from the new values
+        for name in self._CACHED_PROPERTIES:
+            self.__dict__.pop(name, None)
+
+    @cached_property
     def antennas(self):
-        ants = self.obsvar["schedblock.antennas"]
-        ants = ants.replace("'", "").replace(" ", "")
-        return ants[1:-1].split(",") # remove '' and split by comma
+        return _ANT_RE.findall(self.obsvar["schedblock.antennas"])
 
-    @property
+    @cached_property
     def corrmode(self):
         """corrlator mode"""
         return self.obsparams["common.target.src%d.corrmode"]        
         
-    @property
+    @cached_property
     def template(self, ):
         return self.askap_schedblock.template
       
-    @property
+    @cached_property
     def spw(self, ):
         try:
             if self.template in ["OdcWeights", "Beamform"]:
-                return eval(self.obsvar["schedblock.spectral_windows"])[0]
-            return eval(self.obsvar["weights.spectral_windows"])[0]
+                return literal_eval(self.obsvar["schedblock.spectral_windows"])[0]
+            return literal_eval(self.obsvar["weights.spectral_windows"])[0]
         except: return [-1, -1]
         # note - schedblock.spectral_windows is the actual hardware measurement sets spw
         # i.e., for zoom mode observation, schedblock.spectral_windows one is narrower
     
-    @property
+    @cached_property
     def central_freq(self, ):
-        try: return eval(self.obsparams["common.target.src%d.sky_frequency"])
+        try: return literal_eval(self.obsparams["common.target.src%d.sky_frequency"])
         except: return -1
         
-    @property
+    @cached_property
     def footprint(self, ):
         return self.askap_schedblock.get_footprint_name()
     
@@ -203,17 +274,17 @@ class ASKAPSchedBlock:
         try: return self.askap_schedblock.alias
         except: return ""
     
-    @property
+    @cached_property
     def start_time(self, ):
         try: return Time(self.obsvar["executive.start_time"]).mjd # in mjd
         except: return 0
 
-    @property
+    @cached_property
     def sched_time(self, ):
         try: return Time(self.obsvar["scheduler.time"]).mjd # in mjd
         except: return 0
 
-    @property
+    @cached_property
     def weight_sched(self, ):
         try: return int(self.obsvar["weights.schedulingblock"])
         except: return -1
@@ -221,14 +292,27 @@ class ASKAPSchedBlock:
     @property
     def duration(self, ):
         if self.status.value <= 3: return -1 # before execution
-        try: return eval(self.obsvar["executive.duration"])
+        try: return literal_eval(self.obsvar["executive.duration"])
         except: return -1
 
-    @property
+    @cached_property
     def fcm_version(self, ):
-        try: return eval(self.obsvar["fcm.version"])
+        try: return literal_eval(self.obsvar["fcm.version"])
         except: return -1
 
+@lru_cache(maxsize=4)
+def _read_config(path, mtime):
+    """
+    load a json config file, `mtime` is only used for the cache key so that
+    the file is read again once it has been modified
+    """
+    with open(path) as fp:
+        return json.load(fp)
+
+def _sorted_ids(ids):
+    """project ids in a stable order for logging, None means no restriction"""
+    return None if ids is None else sorted(ids)
+
 ### specific class for MWA triggering
 ### we need to use this class when a given SBID is executed/scheduled
 
@@ -243,15 +327,21 @@ class MWATriggerTSP:
             dryrun=True, **kwargs
         ):
         self.sbid = sbid
-        self.askap_project_ids = askap_project_ids
+        self.askap_project_ids = None if askap_project_ids is None else frozenset(askap_project_ids)
         self.mwa_project_id = mwa_project_id
         self.dryrun = dryrun
         self.kwargs = kwargs
 
-        logger.info(f"ASKAP SchedBlock ID - {self.sbid}, allowed ASKAP project IDs - {self.askap_project_ids}, MWA project ID - {self.mwa_project_id}")
+        logger.info(f"ASKAP SchedBlock ID - {self.sbid}, allowed ASKAP project IDs - {_sorted_ids(self.askap_project_ids)}, MWA project ID - {self.mwa_project_id}")
 
-        ### setup sbid checker...
-        self.schedblock = ASKAPSchedBlock(sbid=sbid)
+        ### setup sbid checker... only when it is needed
+        self._schedblock = None
+
+    @property
+    def schedblock(self,):
+        if self._schedblock is None:
+            self._schedblock = ASKAPSchedBlock(sbid=self.sbid)
+        return self._schedblock
 
     def scheduled_run(self,):
         """
@@ -294,19 +384,27 @@ class MWATriggerTSP:
         ecopy = os.environ.copy()
         ecopy.update(environment)
 
-        cmd = f"""`which askap_trigger_mwa` -s {self.sbid} -p {self.mwa_project_id}"""
-        if self.dryrun: cmd += " --dryrun"
+        cmd = [
+            _ASKAP_TRIGGER_MWA_BIN,
+            "-s", str(self.sbid), "-p", str(self.mwa_project_id),
+        ]
+        if self.dryrun: cmd.append("--dryrun")
 
-        subprocess.run(
-            [f"tsp {cmd}"], shell=True, capture_output=True,
-            text=True, env=ecopy,
-        )
+        ### tsp only queues the job and returns, no need to wait for it or to capture the output
+        try:
+            subprocess.Popen(
+                ["tsp", *cmd], env=ecopy,
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            )
+        except OSError as error: # e.g., tsp is not installed
+            logger.error(f"cannot submit the tsp job for SB{self.sbid}... - {error}")
 
 ### this is the class for updating things when a SB status has been changed
 ### you might want to have multiple classes here, they should all inherit from iceint.schedblock.ISBStateMonitor
 class LotrunRunner(iceint.schedblock.ISBStateMonitor):
 
     ASKAP_MWA_TRIGGER_CONFIG = "./askap_trigger_config.json"
+    _EXECUTING_VAL = ObsState.EXECUTING.value # compare plain integers in changed
 
     def __init__(self, values=None):
         super().__init__()
@@ -316,8 +414,8 @@ class LotrunRunner(iceint.schedblock.ISBStateMonitor):
 
     def _load_trigger_config(self,):
         self.project_alias = self.values.project
-        with open(self.ASKAP_MWA_TRIGGER_CONFIG) as fp:
-            trigger_config = json.load(fp)
+        mtime = os.path.getmtime(self.ASKAP_MWA_TRIGGER_CONFIG)
+        trigger_config = _read_config(self.ASKAP_MWA_TRIGGER_CONFIG, mtime)
         if self.project_alias not in trigger_config:
             logger.info(f"configuration for project alias {self.project_alias} not in {self.ASKAP_MWA_TRIGGER_CONFIG}...")
             logger.info(f"proceed with default setup instead...")
@@ -326,20 +424,25 @@ class LotrunRunner(iceint.schedblock.ISBStateMonitor):
             askap_mwa_pairs = trigger_config[self.project_alias]
             logger.info(f"loading setup for project alias {self.project_alias}...")
 
-        self.askap_project_ids = askap_mwa_pairs["askap_project_ids"]
+        ### share one frozenset with all triggers for O(1) owner check
+        askap_project_ids = askap_mwa_pairs["askap_project_ids"]
+        self.askap_project_ids = None if askap_project_ids is None else frozenset(askap_project_ids)
         self.mwa_project_id = askap_mwa_pairs["mwa_project_id"]
-        logger.info(f"Observation from {self.askap_project_ids} will trigger observation for MWA project {self.mwa_project_id}...")
+        logger.info(f"Observation from {_sorted_ids(self.askap_project_ids)} will trigger observation for MWA project {self.mwa_project_id}...")
         
     def changed(self, sbid, state, updated, old_state, current=None):
+        if getattr(state, "value", state) != self._EXECUTING_VAL:
+            ### nothing to do for other states, only log them when debugging
+            logger.debug("ASKAP SB%s status change from %s to %s", sbid, old_state, state)
+            return
         logger.info(f"ASKAP SB{sbid} status change from {old_state} to {state}")
         #########################################################
-        if state == ObsState.EXECUTING:
-            ### TODO - might specify project ids etc in a file...
-            mwatriggertsp = MWATriggerTSP(
-                sbid=sbid, askap_project_ids=self.askap_project_ids,
-                mwa_project_id=self.mwa_project_id, dryrun=self.values.dryrun
-            )
-            mwatriggertsp.executing_run()
+        ### TODO - might specify project ids etc in a file...
+        mwatriggertsp = MWATriggerTSP(
+            sbid=sbid, askap_project_ids=self.askap_project_ids,
+            mwa_project_id=self.mwa_project_id, dryrun=self.values.dryrun
+        )
+        mwatriggertsp.executing_run()
         
 if __name__ == "__main__":
     ### this is for command line argument...
@@ -349,11 +452,12 @@ if __name__ == "__main__":
     parser.add_argument("--dryrun", action="store_true", help="whether run as a dry run or not", default=False)
     values = parser.parse_args()
 
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', 
+        level=logging.INFO,
+    )
+
     runner = LotrunRunner(values=values)
     state = SBStateSubscriber(runner)
-    try:
-        state.ice.waitForShutdown()
-    except KeyboardInterrupt:
-        state.topic.unsubscribe(state.subscriber)
-        state.ice.shutdown()
+    state.wait_for_shutdown()
 
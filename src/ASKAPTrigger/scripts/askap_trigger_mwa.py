@@ -22,6 +22,7 @@ def main():
             logging.FileHandler(f"./log/{values.sbid}.mwatrigger.log"),
             logging.StreamHandler()
         ],
+        force=True, # replace any handler installed before, otherwise the file handler is dropped
     )
     logger = logging.getLogger(__name__)
 
@@ -1,5 +1,7 @@
 #!/usr/bin/python
 
+import logging
+
 from ASKAPTrigger.askaptrigger import LotrunRunner, SBStateSubscriber
 
 def main():
@@ -9,10 +11,11 @@ def main():
     parser.add_argument("--dryrun", action="store_true", help="whether run as a dry run or not", default=False)
     values = parser.parse_args()
 
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', 
+        level=logging.INFO,
+    )
+
     runner = LotrunRunner(values=values)
     state = SBStateSubscriber(runner)
-    try:
-        state.ice.waitForShutdown()
-    except KeyboardInterrupt:
-        state.topic.unsubscribe(state.subscriber)
-        state.ice.shutdown()
\ No newline at end of file
+    state.wait_for_shutdown()
\ No newline at end of file
@@ -6,12 +6,11 @@ import importlib.resources
 import ASKAPTrigger
 
 import logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', 
-    level=logging.INFO,
-)
 logger = logging.getLogger(__name__)
 
+### package data directory, look it up once for all config files
+_PKG_ROOT = importlib.resources.files("ASKAPTrigger")
+
 def _check_config_file(fname):
     if os.path.exists(f"./{fname}"):
         return True
@@ -19,12 +18,16 @@ def _check_config_file(fname):
     return False
 
 def _copy_config_file(fname):
-    fpath = importlib.resources.path("ASKAPTrigger", fname)
     if not _check_config_file(fname):
         logger.info(f"copying file {fname} to the current directory...")
-        shutil.copyfile(os.fspath(fpath), f"./{fname}")
+        with importlib.resources.as_file(_PKG_ROOT / fname) as fpath:
+            shutil.copyfile(fpath, f"./{fname}")
 
 def setup():
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', 
+        level=logging.INFO,
+    )
     configfiles = ["askap_trigger_config.json", "trigger_mwa_config.json"]
     for configfile in configfiles:
         _copy_config_file(configfile)